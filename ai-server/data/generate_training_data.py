@@ -1,6 +1,8 @@
 import numpy as np
 import pandas as pd
 import logging
+from multiprocessing import Pool
+from models.features import FEATURES, to_feature_array
 
 logger = logging.getLogger(__name__)
 
@@ -40,26 +42,73 @@ LIMITATION: This is SIMULATED data. Real-world sensors may exhibit
 different failure patterns not captured here.
 """
 
-def generate_synthetic_data(num_samples=10000, random_seed=42):
+# Category index used for the labels returned by generate_synthetic_data
+CATEGORIES = ('normal', 'dust', 'overheat', 'voltage_drop')
+
+# Uniform sampling range per category (CATEGORIES order): low and high
+# bounds for [voltage, temperature, power_output]
+CATEGORY_RANGES = (
+    # 1. Normal operation (90%)
+    ([11.5, 25, 180], [12.5, 35, 220]),
+    # 2. Dust accumulation (5%)
+    ([10.5, 30, 120], [11.5, 38, 170]),
+    # 3. Overheating (3%)
+    ([10.0, 40, 100], [11.0, 48, 150]),
+    # 4. Voltage drop / connection issues (2%)
+    ([9.0, 25, 80], [10.5, 35, 130]),
+)
+
+
+def _draw_categories(rng, counts):
+    """
+    Draw counts[i] readings of each category with one batched call per category
+    
+    Returns (X, labels), ordered by category (not shuffled).
+    """
+    X = np.vstack([
+        rng.uniform(low=low, high=high, size=(count, 3))
+        for (low, high), count in zip(CATEGORY_RANGES, counts)
+    ])
+    labels = np.repeat(np.arange(len(CATEGORIES), dtype=np.int8), counts)
+    return X, labels
+
+
+def _generate_block(seed_sequence, counts):
+    """
+    Worker entry point: draw one block from its own independent stream
+    """
+    return _draw_categories(np.random.default_rng(seed_sequence), counts)
+
+
+def generate_synthetic_data(num_samples=10000, random_seed=42, return_array=False,
+                            n_workers=1):
     """
     Generate synthetic solar panel sensor data
     
     Args:
         num_samples: Total number of samples to generate
         random_seed: For reproducibility
+        return_array: Return (X, labels) ndarrays instead of dicts
+        n_workers: Number of processes to generate with. Each worker draws
+            from its own SeedSequence.spawn() child stream, so results are
+            reproducible for a given (random_seed, n_workers) pair
     
     Returns:
         List of dicts with keys: voltage, temperature, power_output
+        
+        With return_array=True, a tuple (X, labels) where X is a float64
+        (N, 3) array of [voltage, temperature, power_output] rows and
+        labels holds the category index of each row (see CATEGORIES)
     """
-    np.random.seed(random_seed)
-    
-    data = []
+    seed_sequence = np.random.SeedSequence(random_seed)
+    rng = np.random.default_rng(seed_sequence)
     
     # Calculate samples for each category
     num_normal = int(num_samples * 0.90)
     num_dust = int(num_samples * 0.05)
     num_overheat = int(num_samples * 0.03)
     num_voltage_drop = num_samples - num_normal - num_dust - num_overheat
+    counts = [num_normal, num_dust, num_overheat, num_voltage_drop]
     
     logger.info(f"Generating {num_samples} synthetic samples:")
     logger.info(f"  - Normal: {num_normal}")
@@ -67,47 +116,41 @@ def generate_synthetic_data(num_samples=10000, random_seed=42):
     logger.info(f"  - Overheating: {num_overheat}")
     logger.info(f"  - Voltage drops: {num_voltage_drop}")
     
-    # 1. Normal operation (90%)
-    for _ in range(num_normal):
-        data.append({
-            'voltage': np.random.uniform(11.5, 12.5),
-            'temperature': np.random.uniform(25, 35),
-            'power_output': np.random.uniform(180, 220)
-        })
-    
-    # 2. Dust accumulation (5%)
-    for _ in range(num_dust):
-        data.append({
-            'voltage': np.random.uniform(10.5, 11.5),
-            'temperature': np.random.uniform(30, 38),
-            'power_output': np.random.uniform(120, 170)
-        })
+    if n_workers > 1:
+        # Split every category evenly across workers; spawned child seeds
+        # give statistically independent streams (no correlated workers)
+        child_seeds = seed_sequence.spawn(n_workers)
+        block_counts = [
+            [count // n_workers + (i < count % n_workers) for count in counts]
+            for i in range(n_workers)
+        ]
+        with Pool(n_workers) as pool:
+            blocks = pool.starmap(_generate_block, zip(child_seeds, block_counts))
+        X = np.concatenate([block[0] for block in blocks])
+        labels = np.concatenate([block[1] for block in blocks])
+    else:
+        X, labels = _draw_categories(rng, counts)
     
-    # 3. Overheating (3%)
-    for _ in range(num_overheat):
-        data.append({
-            'voltage': np.random.uniform(10.0, 11.0),
-            'temperature': np.random.uniform(40, 48),
-            'power_output': np.random.uniform(100, 150)
-        })
+    # Shuffle to mix categories (same permutation for rows and labels)
+    order = rng.permutation(num_samples)
+    X = X[order]
+    labels = labels[order]
     
-    # 4. Voltage drop / connection issues (2%)
-    for _ in range(num_voltage_drop):
-        data.append({
-            'voltage': np.random.uniform(9.0, 10.5),
-            'temperature': np.random.uniform(25, 35),
-            'power_output': np.random.uniform(80, 130)
-        })
+    if return_array:
+        logger.info(f"✅ Generated {len(X)} synthetic samples")
+        return X, labels
     
-    # Shuffle to mix categories
-    np.random.shuffle(data)
+    data = [
+        {'voltage': v, 'temperature': t, 'power_output': p}
+        for v, t, p in X.tolist()
+    ]
     
     logger.info(f"✅ Generated {len(data)} synthetic samples")
     
     return data
 
 
-def generate_time_series_data(num_days=30, readings_per_day=288):
+def generate_time_series_data(num_days=30, readings_per_day=288, random_seed=42):
     """
     Generate time-series data simulating continuous monitoring
     
@@ -119,41 +162,44 @@ def generate_time_series_data(num_days=30, readings_per_day=288):
     Args:
         num_days: Number of days to simulate
         readings_per_day: Readings per day (default: every 5 minutes = 288/day)
+        random_seed: For reproducibility
     
     Returns:
         List of dicts with timestamp, voltage, temperature, power_output
     """
     from datetime import datetime, timedelta
     
-    np.random.seed(42)
+    rng = np.random.default_rng(np.random.SeedSequence(random_seed))
     
-    data = []
+    num_readings = num_days * readings_per_day
     start_time = datetime.now() - timedelta(days=num_days)
     
-    # Simulate degradation over time
-    for day in range(num_days):
-        for reading in range(readings_per_day):
-            timestamp = start_time + timedelta(days=day, minutes=reading*5)
-            
-            # Add daily pattern (lower power at night, peak at noon)
-            hour = timestamp.hour
-            time_factor = np.sin((hour - 6) * np.pi / 12) if 6 <= hour <= 18 else 0
-            time_factor = max(0, time_factor)
-            
-            # Simulate gradual degradation
-            degradation_factor = 1 - (day / num_days) * 0.05  # 5% degradation over period
-            
-            # Generate reading
-            base_power = 200 * time_factor * degradation_factor
-            
-            data.append({
-                'timestamp': timestamp.isoformat(),
-                'voltage': np.random.uniform(11.5, 12.5) * degradation_factor,
-                'temperature': np.random.uniform(25, 35) + (hour - 12) * 0.5,
-                'power_output': base_power + np.random.uniform(-10, 10)
-            })
+    # Day index and minute offset of every reading, built in one shot
+    reading_index = np.arange(num_readings)
+    day = reading_index // readings_per_day
+    minutes = day * 24 * 60 + (reading_index % readings_per_day) * 5
+    timestamps = pd.Timestamp(start_time) + pd.to_timedelta(minutes, unit='min')
+    hour = timestamps.hour.to_numpy()
     
-    return data
+    # Add daily pattern (lower power at night, peak at noon)
+    daylight = (hour >= 6) & (hour <= 18)
+    time_factor = np.where(daylight, np.sin((hour - 6) * np.pi / 12), 0.0)
+    time_factor = np.clip(time_factor, 0, None)
+    
+    # Simulate gradual degradation
+    degradation_factor = 1 - (day / num_days) * 0.05  # 5% degradation over period
+    
+    # Generate readings
+    base_power = 200 * time_factor * degradation_factor
+    
+    df = pd.DataFrame({
+        'timestamp': np.datetime_as_string(timestamps.to_numpy(), unit='us'),
+        'voltage': rng.uniform(11.5, 12.5, num_readings) * degradation_factor,
+        'temperature': rng.uniform(25, 35, num_readings) + (hour - 12) * 0.5,
+        'power_output': base_power + rng.uniform(-10, 10, num_readings)
+    })
+    
+    return df.to_dict('records')
 
 
 def save_training_data_to_csv(data, filename='training_data.csv'):
@@ -164,33 +210,57 @@ def save_training_data_to_csv(data, filename='training_data.csv'):
     - Sharing training dataset in documentation
     - Manual inspection of data distribution
     - Creating visualizations for README
+    
+    Args:
+        data: (N, 3) ndarray or list of dicts with keys: voltage, temperature, power_output
+        filename: Output CSV path
     """
-    df = pd.DataFrame(data)
-    df.to_csv(filename, index=False)
+    X = to_feature_array(data, dtype=np.float64)
+    np.savetxt(
+        filename, X, fmt='%.4f', delimiter=',',
+        header=','.join(FEATURES), comments=''
+    )
     logger.info(f"Training data saved to {filename}")
     
     # Print statistics
     logger.info("\nDataset Statistics:")
-    logger.info(df.describe())
+    for name, column in zip(FEATURES, X.T):
+        logger.info(
+            f"  {name}: min={column.min():.2f} mean={column.mean():.2f} "
+            f"std={column.std():.2f} max={column.max():.2f}"
+        )
+
+
+def save_training_data_to_npy(data, filename='training_data.npy'):
+    """
+    Save training data as a binary .npy array
+    
+    Much faster to write and load than CSV (no text formatting), and keeps
+    full float64 precision. Columns are in FEATURES order.
+    """
+    X = to_feature_array(data, dtype=np.float64)
+    np.save(filename, X)
+    logger.info(f"Training data saved to {filename}")
 
 
 if __name__ == '__main__':
     """
     Standalone script to generate and save training data
     
-    Usage:
-        python generate_training_data.py
+    Usage (from ai-server/):
+        python -m data.generate_training_data
     
     Outputs:
-        - training_data.csv: Full dataset
-        - training_data_stats.txt: Statistical summary
+        - training_data.csv: Full dataset, with statistics logged
+        - training_data.npy: Same dataset as a binary array
     """
     logging.basicConfig(level=logging.INFO)
     
     # Generate data
-    data = generate_synthetic_data(num_samples=10000)
+    data, _ = generate_synthetic_data(num_samples=10000, return_array=True)
     
-    # Save to CSV
+    # Save to CSV and .npy
     save_training_data_to_csv(data)
+    save_training_data_to_npy(data)
     
     logger.info("✅ Training data generation complete")
\ No newline at end of file
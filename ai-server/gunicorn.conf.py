@@ -0,0 +1,26 @@
+"""
+Gunicorn configuration for the SolarSentinel AI server
+
+Usage (from ai-server/):
+    gunicorn server:app
+
+preload_app imports server.py once in the master process, so the model is
+loaded (or trained and cached) a single time and forked workers share the
+fitted trees copy-on-write instead of each training their own.
+
+/retrain and /retrain_stream only run in the worker that receives them; the
+retrained model is saved to the model cache file and the other workers
+reload it on their next request.
+"""
+
+import multiprocessing
+
+bind = '0.0.0.0:5000'
+
+# One process per core; threads overlap request I/O inside each worker
+workers = multiprocessing.cpu_count()
+worker_class = 'gthread'
+threads = 4
+
+preload_app = True
+sendfile = True
@@ -0,0 +1,175 @@
+import numpy as np
+import logging
+
+logger = logging.getLogger(__name__)
+
+"""
+Compiled Isolation Forest Scoring
+
+Re-implements IsolationForest.score_samples as a single Numba kernel that
+walks every tree for every reading in one fused loop.
+
+Why:
+- sklearn's score_samples has a fixed per-call cost (input validation,
+  joblib dispatch, one Python-level call per tree) that dominates when
+  scoring one reading or a small batch
+- The fitted trees are flattened once into padded arrays, so the kernel
+  only does array indexing and comparisons
+
+Scores match sklearn's exactly: thresholds stay float64 (as sklearn stores
+them) and leaf path lengths are precomputed in float64.
+
+Numba is optional. Without it NUMBA_AVAILABLE is False and callers keep
+using the sklearn estimator.
+"""
+
+try:
+    from numba import njit, types
+    NUMBA_AVAILABLE = True
+except ImportError:
+    NUMBA_AVAILABLE = False
+
+TREE_LEAF = -1
+
+# Column layout of CompiledForest.nodes
+LEFT, RIGHT, FEATURE = 0, 1, 2
+
+# Samples scored together per pass over the trees
+SAMPLE_BLOCK = 256
+
+# The kernel's win is removing sklearn's fixed per-call overhead (~6ms).
+# Per sample, sklearn's Cython traversal is slightly faster, so on a single
+# core sklearn overtakes the kernel at around 4k rows. Larger batches are
+# left to sklearn.
+MAX_BATCH = 4096
+
+
+def _average_path_length(n_samples):
+    """
+    Average path length of an unsuccessful BST search over n_samples points
+
+    Same normalisation term c(n) used by sklearn's IsolationForest.
+    """
+    n_samples = np.asarray(n_samples, dtype=np.float64)
+    result = np.zeros_like(n_samples)
+
+    result[n_samples == 2] = 1.0
+    large = n_samples > 2
+    n = n_samples[large]
+    result[large] = 2.0 * (np.log(n - 1.0) + np.euler_gamma) - 2.0 * (n - 1.0) / n
+
+    return result
+
+
+if NUMBA_AVAILABLE:
+    # Eagerly compiled for the model's input layout, so the JIT cost is paid
+    # once at import (and cached on disk) rather than on the first request.
+    # Arguments are typed read-only so the same compiled kernel accepts both
+    # freshly built arrays and ones memory-mapped from a saved model.
+    # Deliberately not parallel=True: numba's threading layers are not safe
+    # after gunicorn's preload fork nor under concurrent calls from gthread
+    # workers, and the server already runs one process per core.
+    @njit(
+        types.float64[::1](
+            types.Array(types.float32, 2, 'C', readonly=True),
+            types.Array(types.int32, 3, 'C', readonly=True),
+            types.Array(types.float64, 2, 'C', readonly=True)
+        ),
+        cache=True
+    )
+    def _path_length_sums(X, nodes, values):
+        n_samples = X.shape[0]
+        n_trees = nodes.shape[0]
+        n_blocks = (n_samples + SAMPLE_BLOCK - 1) // SAMPLE_BLOCK
+        depths = np.zeros(n_samples)
+
+        # Within a block of samples each tree is walked for every sample
+        # before moving on, so the tree's nodes stay in cache instead of
+        # streaming the whole forest per sample
+        for block in range(n_blocks):
+            start = block * SAMPLE_BLOCK
+            stop = min(start + SAMPLE_BLOCK, n_samples)
+            for tree in range(n_trees):
+                for i in range(start, stop):
+                    node = 0
+                    while nodes[tree, node, LEFT] != TREE_LEAF:
+                        if X[i, nodes[tree, node, FEATURE]] <= values[tree, node]:
+                            node = nodes[tree, node, LEFT]
+                        else:
+                            node = nodes[tree, node, RIGHT]
+                    depths[i] += values[tree, node]
+
+        return depths
+
+
+class CompiledForest:
+    def __init__(self, forest):
+        """
+        Flatten a fitted sklearn IsolationForest into padded tree arrays
+
+        Trees are padded to the largest tree's node count and stored as:
+        - nodes[tree, node] = (left child, right child, feature), packed so
+          one node visit touches a single small row
+        - values[tree, node] = split threshold for internal nodes, or for
+          leaves depth + c(n_node_samples), the path length sklearn adds to
+          a sample's depth sum when it lands there
+        """
+        if not NUMBA_AVAILABLE:
+            raise RuntimeError("numba is not installed")
+
+        trees = [estimator.tree_ for estimator in forest.estimators_]
+        n_trees = len(trees)
+        max_nodes = max(tree.node_count for tree in trees)
+
+        self.nodes = np.full((n_trees, max_nodes, 3), TREE_LEAF, dtype=np.int32)
+        self.values = np.zeros((n_trees, max_nodes), dtype=np.float64)
+
+        n_features = forest.n_features_in_
+
+        for index, (tree, features) in enumerate(
+            zip(trees, forest.estimators_features_)
+        ):
+            n_nodes = tree.node_count
+            left = tree.children_left
+            right = tree.children_right
+            is_leaf = left == TREE_LEAF
+
+            # Trees fitted on a feature subset index into that subset
+            feature = np.where(is_leaf, 0, tree.feature)
+            if forest.bootstrap_features or len(features) != n_features:
+                feature = np.asarray(features)[feature]
+
+            # Node ids are assigned depth-first, so parents precede children
+            depth = np.zeros(n_nodes)
+            for node in np.flatnonzero(~is_leaf):
+                depth[left[node]] = depth[right[node]] = depth[node] + 1
+
+            self.nodes[index, :n_nodes, LEFT] = left
+            self.nodes[index, :n_nodes, RIGHT] = right
+            self.nodes[index, :n_nodes, FEATURE] = feature
+            self.values[index, :n_nodes] = np.where(
+                is_leaf,
+                depth + _average_path_length(tree.n_node_samples),
+                tree.threshold
+            )
+
+        self.denominator = n_trees * float(_average_path_length([forest.max_samples_])[0])
+
+        logger.info(f"Compiled forest scorer ready ({n_trees} trees, {max_nodes} max nodes)")
+
+    def score_samples(self, X):
+        """
+        Equivalent of IsolationForest.score_samples for a float32 (N, 3) array
+        """
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        # NaN fails every split comparison and would still get a score, so
+        # reject it as sklearn's input validation does
+        if not np.isfinite(X).all():
+            raise ValueError("Input contains NaN or infinity")
+        depths = _path_length_sums(X, self.nodes, self.values)
+
+        # For a single training sample, denominator and depth are 0; sklearn
+        # then uses a depth ratio of 1, i.e. a score of -2 ** -1
+        if self.denominator == 0:
+            return np.full(len(X), -0.5)
+        return -(2.0 ** (-depths / self.denominator))
@@ -0,0 +1,45 @@
+import numpy as np
+
+"""
+Sensor Feature Layout
+
+Single definition of the feature columns shared by the model and the
+training data generator.
+"""
+
+# Feature column order expected by the model
+FEATURES = ('voltage', 'temperature', 'power_output')
+
+# IsolationForest converts every input to float32 before walking its trees,
+# so building inputs in float32 up front skips that conversion copy and halves
+# the bytes per reading. float32 is far more precise than the sensor ADCs.
+FEATURE_DTYPE = np.float32
+
+
+def to_feature_array(data, dtype=FEATURE_DTYPE):
+    """
+    Convert readings to a C-contiguous (N, 3) array in FEATURES order
+    
+    Args:
+        data: (N, 3) ndarray, or a list of dicts keyed by FEATURES
+        dtype: Element type of the result
+    
+    ndarrays are passed through without copying when already in that
+    layout; lists of dicts are flattened in a single pass.
+    
+    Raises:
+        ValueError: if any value is NaN or infinite. A JSON null becomes NaN
+            here, and the forest would silently fit or score it.
+    """
+    if isinstance(data, np.ndarray):
+        X = np.ascontiguousarray(data, dtype=dtype)
+    else:
+        X = np.fromiter(
+            (d[key] for d in data for key in FEATURES),
+            dtype=dtype,
+            count=len(data) * len(FEATURES)
+        ).reshape(-1, len(FEATURES))
+    
+    if not np.isfinite(X).all():
+        raise ValueError("readings must contain only finite numbers")
+    return X
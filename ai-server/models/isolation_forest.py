@@ -1,9 +1,16 @@
+from dataclasses import dataclass
 import numpy as np
+from sklearn.base import clone
 from sklearn.ensemble import IsolationForest
 from sklearn.model_selection import train_test_split
 from sklearn.metrics import precision_score, recall_score, f1_score, confusion_matrix
 import joblib
 import logging
+import os
+import pickle
+import threading
+from models import fast_scoring
+from models.features import FEATURES, FEATURE_DTYPE, to_feature_array
 
 logger = logging.getLogger(__name__)
 
@@ -33,6 +40,156 @@ CRITICAL LIMITATION: Real-world validation pending.
 Synthetic data may not capture all failure modes.
 """
 
+# Core of the healthy-panel cluster ([low, high] per feature, FEATURES order).
+# Readings inside it are answered without walking the forest, provided the
+# trained model scores every probe point in the box as normal (see
+# _calibrate_fast_path). The box is the synthetic "normal operation" range
+# shrunk by 10% on each side: the outer faces of that range sit on the
+# forest's decision boundary, the inset box covers roughly half of all
+# healthy readings with a clear margin.
+NORMAL_CORE = np.array([
+    [11.6, 12.4],   # voltage (V)
+    [26.0, 34.0],   # temperature (°C)
+    [184.0, 216.0]  # power_output (W)
+], dtype=FEATURE_DTYPE)
+
+# Random points checked inside NORMAL_CORE, on top of the grid, before the
+# fast path is enabled (see _calibrate_fast_path)
+FAST_PATH_RANDOM_PROBES = 2048
+
+MODEL_VERSION_TAG = 'v1.0-isolation-forest'
+
+
+@dataclass(frozen=True)
+class PredictionResult:
+    """
+    Result of a single prediction
+    
+    A slotted, immutable record instead of a per-call dict: cheaper to build,
+    and the fast-path result can be returned as one shared instance.
+    orjson serializes dataclasses natively, to the same JSON object the
+    dict used to produce.
+    """
+    __slots__ = ('prediction', 'confidence', 'model_version', 'anomaly_score')
+    
+    prediction: str       # 'Normal' | 'Failure Likely'
+    confidence: float     # 0-1
+    model_version: str
+    anomaly_score: float
+
+
+def _calculate_confidence(anomaly_score):
+    """
+    Convert anomaly score to confidence (0-1)
+
+    Anomaly scores from Isolation Forest are typically in range [-0.5, 0.5]
+    - Negative scores = anomalies (more negative = more anomalous)
+    - Positive scores = normal (more positive = more normal)
+
+    We map this to confidence where:
+    - score > 0.1 → confidence > 0.9 (very confident normal)
+    - score < -0.1 → confidence > 0.9 (very confident anomaly)
+    - score ≈ 0 → confidence ≈ 0.5 (uncertain)
+
+    Accepts a scalar or an ndarray of scores and returns the same shape.
+    """
+    # Using sigmoid-like transformation. For anomalies (score < 0) the
+    # confidence is 1 - sigmoid(10 * score) == sigmoid(10 * |score|), so a
+    # single expression covers both cases without branching. float32 is
+    # ample precision for a 0-1 confidence and halves the work in np.exp.
+    anomaly_score = np.asarray(anomaly_score, dtype=np.float32)
+    # The sigmoid output is already in [0, 1], so no clipping is needed
+    return 1.0 / (1.0 + np.exp(-np.abs(anomaly_score) * 10.0))
+
+
+class _FittedForest:
+    """
+    A fitted estimator together with everything derived from it for inference
+    
+    Built completely before it is published on IsolationForestModel._fitted,
+    and never modified afterwards. Swapping that one reference is atomic, so
+    request threads see either the old model or the new one, never a mix of
+    one forest's scores with another's offset_.
+    """
+    __slots__ = (
+        'estimator', 'scorer', 'training_samples', 'validation_metrics',
+        'fast_path_score', 'fast_path_result'
+    )
+    
+    def __init__(self, estimator, training_samples, validation_metrics, scorer=None):
+        """
+        Args:
+            estimator: Fitted IsolationForest
+            training_samples: Number of readings it was trained on
+            validation_metrics: Metrics from train(validate=True), or {}
+            scorer: Previously saved CompiledForest for this estimator,
+                reused instead of flattening the trees again
+        """
+        self.estimator = estimator
+        self.training_samples = training_samples
+        self.validation_metrics = validation_metrics
+        
+        # Flatten the trees for the numba kernel when available; otherwise
+        # fall back to sklearn's own score_samples
+        if not fast_scoring.NUMBA_AVAILABLE:
+            scorer = None
+        elif scorer is None:
+            scorer = fast_scoring.CompiledForest(estimator)
+        self.scorer = scorer
+        
+        self._calibrate_fast_path()
+    
+    def score_samples(self, X):
+        """
+        IsolationForest.score_samples, via the compiled scorer when available
+        
+        Batches larger than fast_scoring.MAX_BATCH go to sklearn, which is
+        faster per sample once its fixed call overhead is amortized.
+        """
+        if self.scorer is not None and len(X) <= fast_scoring.MAX_BATCH:
+            return self.scorer.score_samples(X)
+        return self.estimator.score_samples(X)
+    
+    def _calibrate_fast_path(self):
+        """
+        Enable the NORMAL_CORE fast path if the fitted forest agrees
+        
+        A heuristic check, not a guarantee: the forest is probed at a 3x3x3
+        grid spanning NORMAL_CORE (corners, edges and centre) plus
+        FAST_PATH_RANDOM_PROBES seeded uniform points inside it, and the fast
+        path is only enabled when every probe is classified normal. Readings
+        between probes are not checked.
+        
+        Fast-path readings report the lowest probe score. Retraining on data
+        where the box is not healthy disables the fast path.
+        """
+        grids = np.meshgrid(*(np.linspace(lo, hi, 3) for lo, hi in NORMAL_CORE))
+        rng = np.random.default_rng(0)
+        probes = np.vstack([
+            np.column_stack([g.ravel() for g in grids]),
+            rng.uniform(
+                NORMAL_CORE[:, 0], NORMAL_CORE[:, 1],
+                size=(FAST_PATH_RANDOM_PROBES, len(FEATURES))
+            )
+        ]).astype(FEATURE_DTYPE)
+        probe_scores = self.score_samples(probes)
+        
+        if np.any(probe_scores - self.estimator.offset_ < 0):
+            self.fast_path_score = None
+            self.fast_path_result = None
+            logger.info("Fast path disabled: model does not score NORMAL_CORE as normal")
+            return
+        
+        score = float(probe_scores.min())
+        self.fast_path_score = score
+        self.fast_path_result = PredictionResult(
+            'Normal',
+            float(_calculate_confidence(score)),
+            MODEL_VERSION_TAG,
+            score
+        )
+
+
 class IsolationForestModel:
     def __init__(self):
         """
@@ -44,23 +201,47 @@ class IsolationForestModel:
         - max_samples: 256 (sufficient for pattern learning)
         - random_state: 42 (reproducibility)
         """
-        self.model = IsolationForest(
+        self._template = IsolationForest(
             contamination=0.1,  # Expect 10% of data to be anomalies
             n_estimators=100,    # Number of trees
             max_samples=256,     # Samples per tree
             random_state=42,     # For reproducibility
             n_jobs=-1            # Use all CPU cores
         )
-        self.is_trained = False
-        self.training_samples = 0
-        self.validation_metrics = {}
+        # Everything predictions need, published as one object (see
+        # _FittedForest). None until the model is trained or loaded.
+        self._fitted = None
+    
+    @property
+    def model(self):
+        """The fitted IsolationForest, or the unfitted template"""
+        fitted = self._fitted
+        return fitted.estimator if fitted is not None else self._template
+    
+    @property
+    def is_trained(self):
+        return self._fitted is not None
+    
+    @property
+    def training_samples(self):
+        fitted = self._fitted
+        return fitted.training_samples if fitted is not None else 0
+    
+    @property
+    def validation_metrics(self):
+        fitted = self._fitted
+        return fitted.validation_metrics if fitted is not None else {}
         
-    def train(self, training_data):
+    def train(self, training_data, validate=False):
         """
         Train the model on provided data
         
         Args:
-            training_data: List of dicts with keys: voltage, temperature, power_output
+            training_data: (N, 3) ndarray of [voltage, temperature, power_output]
+                rows, or a list of dicts with those keys
+            validate: Hold out 20% of the data and compute validation metrics.
+                When False the model is fit on all samples and no metrics
+                are computed (faster, suited to field-data retrains)
         
         Expected ranges (based on African solar conditions):
         - Voltage: 9-13V (12V panel with degradation)
@@ -68,51 +249,50 @@ class IsolationForestModel:
         - Power Output: 50-250W (200W panel with losses)
         """
         try:
-            # Convert to numpy array
-            X = np.array([[
-                d['voltage'],
-                d['temperature'],
-                d['power_output']
-            ] for d in training_data])
+            X = to_feature_array(training_data)
+            
+            logger.info(f"Training on {len(X)} samples...")
             
-            self.training_samples = len(X)
-            logger.info(f"Training on {self.training_samples} samples...")
+            # Fit a fresh estimator; the model currently serving predictions
+            # is left untouched until the new one is fully prepared
+            estimator = clone(self._template)
+            
+            if not validate:
+                estimator.fit(X)
+                self._fitted = _FittedForest(estimator, len(X), {})
+                logger.info("✅ Training complete (validation skipped)")
+                return self.validation_metrics
             
             # Split for validation
             X_train, X_test = train_test_split(X, test_size=0.2, random_state=42)
             
             # Train model
-            self.model.fit(X_train)
-            self.is_trained = True
+            estimator.fit(X_train)
             
             # Validate on test set
-            y_pred = self.model.predict(X_test)
+            y_pred = estimator.predict(X_test)
             
-            # Convert predictions: -1 (anomaly) to 1, 1 (normal) to 0 for metrics calculation
             # We need ground truth for proper validation, so we'll use a simple heuristic:
             # Consider samples with voltage < 10 OR temperature > 40 OR power < 100 as anomalies
-            y_true = np.array([
-                -1 if (sample[0] < 10 or sample[1] > 40 or sample[2] < 100) else 1
-                for sample in X_test
-            ])
-            
-            # Calculate metrics
-            # Convert to binary: anomaly=1, normal=0
-            y_true_binary = (y_true == -1).astype(int)
-            y_pred_binary = (y_pred == -1).astype(int)
+            # Convert to binary for metrics calculation: anomaly=1, normal=0
+            y_true_binary = (
+                (X_test[:, 0] < 10) | (X_test[:, 1] > 40) | (X_test[:, 2] < 100)
+            ).astype(np.int8)
+            y_pred_binary = (y_pred == -1).astype(np.int8)
             
             precision = precision_score(y_true_binary, y_pred_binary, zero_division=0)
             recall = recall_score(y_true_binary, y_pred_binary, zero_division=0)
             f1 = f1_score(y_true_binary, y_pred_binary, zero_division=0)
             cm = confusion_matrix(y_true_binary, y_pred_binary)
             
-            self.validation_metrics = {
+            validation_metrics = {
                 'precision': float(precision),
                 'recall': float(recall),
                 'f1_score': float(f1),
                 'confusion_matrix': cm.tolist(),
                 'test_samples': len(X_test)
             }
+            self._fitted = _FittedForest(estimator, len(X), validation_metrics)
             
             logger.info(f"✅ Training complete. Validation metrics:")
             logger.info(f"   Precision: {precision:.3f}")
@@ -120,7 +300,7 @@ class IsolationForestModel:
             logger.info(f"   F1-Score: {f1:.3f}")
             logger.info(f"   Confusion Matrix:\n{cm}")
             
-            return self.validation_metrics
+            return validation_metrics
             
         except Exception as e:
             logger.error(f"Training failed: {e}")
@@ -136,91 +316,101 @@ class IsolationForestModel:
             power_output: Power output (W)
         
         Returns:
-            {
-                'prediction': 'Normal' | 'Failure Likely',
-                'confidence': float (0-1),
-                'model_version': str
-            }
+            PredictionResult(prediction, confidence, model_version, anomaly_score)
+        """
+        # Fast path: reading deep inside the healthy cluster
+        fitted = self._fitted
+        if fitted is not None and fitted.fast_path_result is not None and (
+            NORMAL_CORE[0, 0] <= voltage <= NORMAL_CORE[0, 1]
+            and NORMAL_CORE[1, 0] <= temperature <= NORMAL_CORE[1, 1]
+            and NORMAL_CORE[2, 0] <= power_output <= NORMAL_CORE[2, 1]
+        ):
+            return fitted.fast_path_result
+        
+        X = np.array([[voltage, temperature, power_output]], dtype=FEATURE_DTYPE)
+        return self.predict_batch(X)[0]
+    
+    def predict_batch(self, X):
+        """
+        Predict failures for many sensor readings in one forest traversal
+        
+        Args:
+            X: (N, 3) array-like of [voltage, temperature, power_output] rows
+        
+        Returns:
+            List of N PredictionResult, in input order
         """
-        if not self.is_trained:
+        # Read the fitted state once so a concurrent retrain cannot mix
+        # scores from one forest with the offset of another
+        fitted = self._fitted
+        if fitted is None:
             raise Exception("Model not trained. Call train() first.")
         
         try:
             # Prepare input
-            X = np.array([[voltage, temperature, power_output]])
-            
-            # Get prediction (-1 = anomaly, 1 = normal)
-            prediction_value = self.model.predict(X)[0]
+            X = np.asarray(X, dtype=FEATURE_DTYPE)
+            if X.ndim != 2 or X.shape[1] != len(FEATURES):
+                raise ValueError(
+                    f"Expected readings of shape (N, {len(FEATURES)}), got {X.shape}"
+                )
             
-            # Get anomaly score (lower = more anomalous)
+            # Get anomaly scores (lower = more anomalous)
             # Score ranges from ~-0.5 to ~0.5
-            anomaly_score = self.model.score_samples(X)[0]
+            # Readings inside the healthy core reuse the calibrated score;
+            # only the remainder is sent through the forest
+            if fitted.fast_path_score is not None:
+                in_core = np.all(
+                    (X >= NORMAL_CORE[:, 0]) & (X <= NORMAL_CORE[:, 1]), axis=1
+                )
+                anomaly_scores = np.full(len(X), fitted.fast_path_score)
+                if not in_core.all():
+                    anomaly_scores[~in_core] = fitted.score_samples(X[~in_core])
+            else:
+                anomaly_scores = fitted.score_samples(X)
+            
+            # Derive predictions from the same scores instead of a second
+            # forest pass: IsolationForest.predict flags -1 (anomaly) when
+            # score_samples - offset_ < 0
+            is_normal = (anomaly_scores - fitted.estimator.offset_) >= 0
             
             # Convert to confidence (0-1 scale)
             # Anomaly scores are typically between -0.5 and 0.5
             # We normalize to 0-1 where 1 = high confidence
-            confidence = self._calculate_confidence(anomaly_score)
-            
-            # Determine prediction label
-            prediction_label = "Normal" if prediction_value == 1 else "Failure Likely"
+            confidences = _calculate_confidence(anomaly_scores)
             
-            result = {
-                'prediction': prediction_label,
-                'confidence': float(confidence),
-                'model_version': 'v1.0-isolation-forest',
-                'anomaly_score': float(anomaly_score)
-            }
-            
-            return result
+            return [
+                PredictionResult(
+                    "Normal" if normal else "Failure Likely",
+                    confidence,
+                    MODEL_VERSION_TAG,
+                    score
+                )
+                for normal, confidence, score in zip(
+                    is_normal.tolist(), confidences.tolist(), anomaly_scores.tolist()
+                )
+            ]
             
         except Exception as e:
             logger.error(f"Prediction failed: {e}")
             raise
     
-    def _calculate_confidence(self, anomaly_score):
-        """
-        Convert anomaly score to confidence (0-1)
-        
-        Anomaly scores from Isolation Forest are typically in range [-0.5, 0.5]
-        - Negative scores = anomalies (more negative = more anomalous)
-        - Positive scores = normal (more positive = more normal)
-        
-        We map this to confidence where:
-        - score > 0.1 → confidence > 0.9 (very confident normal)
-        - score < -0.1 → confidence > 0.9 (very confident anomaly)
-        - score ≈ 0 → confidence ≈ 0.5 (uncertain)
-        """
-        # Normalize score to 0-1 range
-        # Using sigmoid-like transformation
-        normalized = 1 / (1 + np.exp(-anomaly_score * 10))
-        
-        # For anomalies (score < 0), invert to show confidence in anomaly detection
-        if anomaly_score < 0:
-            confidence = 1 - normalized
-        else:
-            confidence = normalized
-        
-        # Ensure confidence is in [0, 1]
-        confidence = max(0.0, min(1.0, confidence))
-        
-        return confidence
-    
     def get_info(self):
         """
         Get model information and metrics
         
         Returns model metadata useful for documentation and debugging
         """
+        fitted = self._fitted
         info = {
             'model_type': 'Isolation Forest',
-            'is_trained': self.is_trained,
-            'training_samples': self.training_samples,
+            'is_trained': fitted is not None,
+            'training_samples': fitted.training_samples if fitted else 0,
             'hyperparameters': {
                 'contamination': 0.1,
                 'n_estimators': 100,
                 'max_samples': 256
             },
-            'validation_metrics': self.validation_metrics,
+            'validation_metrics': fitted.validation_metrics if fitted else {},
             'version': 'v1.0',
             'limitations': [
                 'Trained on synthetic data only',
@@ -240,11 +430,27 @@ class IsolationForestModel:
         - Version control
         - Avoiding retraining on every restart
         """
-        if not self.is_trained:
+        fitted = self._fitted
+        if fitted is None:
             raise Exception("Cannot save untrained model")
         
         try:
-            joblib.dump(self.model, filepath)
+            # Store training metadata alongside the estimator so a loaded
+            # model reports the same info as a freshly trained one, plus the
+            # flattened tree arrays of the compiled scorer.
+            # Uncompressed so load_model can memory-map the arrays; written
+            # to a temp file and renamed so processes that still have the
+            # old file mapped keep reading intact data.
+            # The temp name is unique per writer, since several workers may
+            # save a retrained model at once.
+            tmp_filepath = f"{filepath}.{os.getpid()}.{threading.get_ident()}.tmp"
+            joblib.dump({
+                'model': fitted.estimator,
+                'scorer': fitted.scorer,
+                'training_samples': fitted.training_samples,
+                'validation_metrics': fitted.validation_metrics
+            }, tmp_filepath, compress=0, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp_filepath, filepath)
             logger.info(f"Model saved to {filepath}")
         except Exception as e:
             logger.error(f"Failed to save model: {e}")
@@ -253,10 +459,25 @@ class IsolationForestModel:
     def load_model(self, filepath='model_isolation_forest.joblib'):
         """
         Load trained model from disk
+        
+        numpy arrays in the file are memory-mapped read-only, so worker
+        processes loading the same file share one copy of the compiled
+        scorer's tree arrays through the OS page cache. (sklearn copies its
+        own tree nodes out of the file when unpickling.)
         """
         try:
-            self.model = joblib.load(filepath)
-            self.is_trained = True
+            saved = joblib.load(filepath, mmap_mode='r')
+            if isinstance(saved, dict):
+                fitted = _FittedForest(
+                    saved['model'],
+                    saved.get('training_samples', 0),
+                    saved.get('validation_metrics', {}),
+                    saved.get('scorer')
+                )
+            else:
+                # Older files hold the bare estimator
+                fitted = _FittedForest(saved, 0, {})
+            self._fitted = fitted
             logger.info(f"Model loaded from {filepath}")
         except Exception as e:
             logger.error(f"Failed to load model: {e}")
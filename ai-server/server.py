@@ -1,7 +1,16 @@
 from flask import Flask, request, jsonify
+from flask.json.provider import JSONProvider
 from flask_cors import CORS
+import io
 import logging
-from models.isolation_forest import IsolationForestModel
+import os
+import threading
+import numpy as np
+import orjson
+from models.isolation_forest import (
+    IsolationForestModel, FEATURES, FEATURE_DTYPE, MODEL_VERSION_TAG
+)
+from models.features import to_feature_array
 
 """
 SolarSentinel AI Server
@@ -21,8 +30,73 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Trained models are cached on disk so restarts (and every worker process)
+# load the forest instead of retraining it. Bump MODEL_VERSION to invalidate
+# the cache after changing the training data or hyperparameters.
+MODEL_VERSION = os.environ.get('MODEL_VERSION', 'v1.0')
+MODEL_PATH = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    f'model_isolation_forest_{MODEL_VERSION}.joblib'
+)
+
+# Identity (mtime, inode) of the MODEL_PATH file this process last loaded.
+# Retrains are saved to MODEL_PATH, and every worker reloads the model when
+# the file changes, so a retrain reaches all workers, not only the one that
+# handled the request.
+_loaded_model_file = None
+_model_reload_lock = threading.Lock()
+
+# Expected sensor ranges per feature (FEATURES order): [low, high] and the
+# label/unit used in warnings. Readings outside are logged, not rejected.
+INPUT_BOUNDS = np.array([
+    [8, 14],   # voltage (V)
+    [15, 50],  # temperature (°C)
+    [0, 300]   # power_output (W)
+], dtype=FEATURE_DTYPE)
+_INPUT_BOUNDS_SCALAR = tuple(zip(
+    INPUT_BOUNDS[:, 0].tolist(),
+    INPUT_BOUNDS[:, 1].tolist(),
+    (('Voltage', 'V'), ('Temperature', '°C'), ('Power output', 'W'))
+))
+
+# Maximum readings accepted by one /predict_batch request
+PREDICT_BATCH_MAX_READINGS = int(os.environ.get('PREDICT_BATCH_MAX_READINGS', 10000))
+
+# 400 message for a /predict_batch body that is not a list of readings
+READINGS_SHAPE_ERROR = f"readings must be a list of [{', '.join(FEATURES)}]"
+
+# Maximum rows accepted by /retrain_stream. IsolationForest only draws 256
+# samples per tree, so rows beyond this cap add memory but not accuracy.
+RETRAIN_STREAM_MAX_ROWS = int(os.environ.get('RETRAIN_STREAM_MAX_ROWS', 100000))
+
+
+class OrjsonProvider(JSONProvider):
+    """
+    Flask JSON provider backed by orjson
+    
+    orjson encodes several times faster than the stdlib json module and
+    writes bytes directly, so jsonify() responses skip the str -> bytes
+    round trip. numpy scalars/arrays and dataclasses (PredictionResult) are
+    serialized natively.
+    """
+    
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY).decode()
+    
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        return self._app.response_class(
+            orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY),
+            mimetype='application/json'
+        )
+
+
 # Initialize Flask app
 app = Flask(__name__)
+app.json = OrjsonProvider(app)
 CORS(app)  # Enable CORS for frontend communication
 
 # Initialize ML model
@@ -34,6 +108,56 @@ except Exception as e:
     model = None
 
 
+def _model_file_identity():
+    try:
+        stat = os.stat(MODEL_PATH)
+    except OSError:
+        return None
+    return (stat.st_mtime_ns, stat.st_ino)
+
+
+@app.before_request
+def reload_model_if_changed():
+    """
+    Pick up a model retrained (and saved) by another worker
+    
+    One stat() per request. Only one thread reloads; the others keep
+    serving the current model meanwhile.
+    """
+    global _loaded_model_file
+    
+    if not model:
+        return
+    identity = _model_file_identity()
+    if identity is None or identity == _loaded_model_file:
+        return
+    if not _model_reload_lock.acquire(blocking=False):
+        return
+    try:
+        if identity != _loaded_model_file:
+            model.load_model(MODEL_PATH)
+            logger.info(f"Reloaded model ({model.training_samples} training samples)")
+    except Exception as e:
+        logger.error(f"Model reload failed, keeping current model: {e}")
+    finally:
+        # Recorded on failure too, so a bad file is not retried every request
+        _loaded_model_file = identity
+        _model_reload_lock.release()
+
+
+def _save_retrained_model():
+    """
+    Save a retrained model to MODEL_PATH for the other workers
+    
+    This worker also reloads it on its next request, so when several
+    workers retrain at once all of them settle on the last file written.
+    """
+    try:
+        model.save_model(MODEL_PATH)
+    except Exception as e:
+        logger.warning(f"Retrained model not saved, other workers keep the old one: {e}")
+
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """
@@ -43,7 +167,7 @@ def health_check():
     return jsonify({
         'status': 'ok' if model and model.is_trained else 'error',
         'model_trained': model.is_trained if model else False,
-        'model_version': 'v1.0-isolation-forest',
+        'model_version': MODEL_VERSION_TAG,
         'training_samples': model.training_samples if model else 0
     }), 200
 
@@ -87,12 +211,11 @@ def predict():
             }), 400
         
         # Validate ranges (warn but don't reject)
-        if not (8 <= voltage <= 14):
-            logger.warning(f"Voltage out of expected range: {voltage}V")
-        if not (15 <= temperature <= 50):
-            logger.warning(f"Temperature out of expected range: {temperature}°C")
-        if not (0 <= power_output <= 300):
-            logger.warning(f"Power output out of expected range: {power_output}W")
+        for value, (low, high, (label, unit)) in zip(
+            (voltage, temperature, power_output), _INPUT_BOUNDS_SCALAR
+        ):
+            if not (low <= value <= high):
+                logger.warning(f"{label} out of expected range: {value}{unit}")
         
         # Make prediction
         if not model or not model.is_trained:
@@ -102,8 +225,8 @@ def predict():
         
         prediction_result = model.predict(voltage, temperature, power_output)
         
-        logger.info(f"Prediction: {prediction_result['prediction']} "
-                   f"(confidence: {prediction_result['confidence']:.3f})")
+        logger.info(f"Prediction: {prediction_result.prediction} "
+                   f"(confidence: {prediction_result.confidence:.3f})")
         
         return jsonify(prediction_result), 200
         
@@ -115,6 +238,88 @@ def predict():
         }), 500
 
 
+@app.route('/predict_batch', methods=['POST'])
+def predict_batch():
+    """
+    Batch prediction endpoint
+    
+    Scores many sensor readings with a single model call, which is far
+    cheaper per reading than calling /predict once per panel.
+    At most PREDICT_BATCH_MAX_READINGS readings per request.
+    
+    Request body:
+    {
+        "readings": [
+            [voltage, temperature, power_output],
+            ...
+        ]
+    }
+    
+    Returns:
+    {
+        "predictions": [
+            {"prediction": ..., "confidence": ..., "model_version": ...},
+            ...
+        ]
+    }
+    """
+    try:
+        # Validate request
+        data = request.get_json()
+        if not data:
+            return jsonify({'error': 'No JSON data provided'}), 400
+        
+        readings = data.get('readings') if isinstance(data, dict) else None
+        if isinstance(data, dict) and not readings:
+            return jsonify({'error': 'Missing required field: readings'}), 400
+        if not isinstance(readings, list):
+            return jsonify({'error': READINGS_SHAPE_ERROR}), 400
+        if len(readings) > PREDICT_BATCH_MAX_READINGS:
+            return jsonify({
+                'error': f'Too many readings (max {PREDICT_BATCH_MAX_READINGS} per request)'
+            }), 413
+        
+        try:
+            X = np.asarray(readings, dtype=FEATURE_DTYPE)
+        except (TypeError, ValueError):
+            X = None
+        if X is None or X.ndim != 2 or X.shape[1] != len(FEATURES):
+            return jsonify({'error': READINGS_SHAPE_ERROR}), 400
+        # null converts to NaN (and values beyond float32 range to inf),
+        # which the forest would silently score
+        if not np.isfinite(X).all():
+            return jsonify({'error': 'readings must contain only finite numbers'}), 400
+        
+        # Validate ranges (warn but don't reject)
+        out_of_range = (X < INPUT_BOUNDS[:, 0]) | (X > INPUT_BOUNDS[:, 1])
+        if out_of_range.any():
+            for count, (_, _, (label, _)) in zip(
+                out_of_range.sum(axis=0).tolist(), _INPUT_BOUNDS_SCALAR
+            ):
+                if count:
+                    logger.warning(f"{label} out of expected range in {count} readings")
+        
+        # Make predictions
+        if not model or not model.is_trained:
+            return jsonify({
+                'error': 'Model not trained. Run training first.'
+            }), 500
+        
+        predictions = model.predict_batch(X)
+        
+        logger.info(f"Batch prediction: {len(predictions)} readings, "
+                   f"{sum(p.prediction != 'Normal' for p in predictions)} flagged")
+        
+        return jsonify({'predictions': predictions}), 200
+        
+    except Exception as e:
+        logger.error(f"Batch prediction failed: {e}")
+        return jsonify({
+            'error': 'Prediction failed',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/retrain', methods=['POST'])
 def retrain():
     """
@@ -140,10 +345,19 @@ def retrain():
                 'error': 'Need at least 100 training samples'
             }), 400
         
-        # Retrain model
-        model.train(training_data)
+        try:
+            X = to_feature_array(training_data)
+        except (ValueError, KeyError, TypeError) as e:
+            return jsonify({
+                'error': 'Invalid training data',
+                'message': str(e)
+            }), 400
+        
+        # Retrain model (skip the validation pass for fast field-data updates)
+        model.train(X, validate=False)
+        _save_retrained_model()
         
-        logger.info(f"Model retrained with {len(training_data)} samples")
+        logger.info(f"Model retrained with {len(X)} samples")
         
         return jsonify({
             'status': 'success',
@@ -159,6 +373,105 @@ def retrain():
         }), 500
 
 
+@app.route('/retrain_stream', methods=['POST'])
+def retrain_stream():
+    """
+    Streaming retrain endpoint
+    
+    Same as /retrain, but reads newline-delimited JSON one row at a time
+    so large field uploads (e.g. sent with Transfer-Encoding: chunked) never
+    have to be held in memory as one JSON document
+    
+    Request body (Content-Type: application/x-ndjson), one reading per line:
+        {"voltage": float, "temperature": float, "power_output": float}
+    or
+        [voltage, temperature, power_output]
+    
+    At most RETRAIN_STREAM_MAX_ROWS rows are used; any further rows are
+    ignored and reported via "truncated".
+    """
+    try:
+        # Rows are collected into a preallocated buffer that grows
+        # geometrically, instead of a list of per-row Python objects.
+        # line_numbers maps each row back to its input line for errors.
+        buffer = np.empty((1024, len(FEATURES)), dtype=FEATURE_DTYPE)
+        line_numbers = np.empty(len(buffer), dtype=np.int64)
+        num_rows = 0
+        truncated = False
+        
+        # Werkzeug's LimitedStream (used by the dev server) is unbuffered, so
+        # iterating it reads one byte per call. Servers that terminate the
+        # input themselves (gunicorn) hand over their own buffered stream.
+        stream = request.stream
+        if isinstance(stream, io.RawIOBase):
+            stream = io.BufferedReader(stream)
+        
+        for line_number, line in enumerate(stream, start=1):
+            line = line.strip()
+            if not line:
+                continue
+            
+            if num_rows == RETRAIN_STREAM_MAX_ROWS:
+                truncated = True
+                break
+            
+            try:
+                row = orjson.loads(line)
+                if isinstance(row, dict):
+                    row = [row[key] for key in FEATURES]
+                if len(row) != len(FEATURES):
+                    raise ValueError(f"expected {len(FEATURES)} values")
+                
+                if num_rows == len(buffer):
+                    capacity = min(2 * len(buffer), RETRAIN_STREAM_MAX_ROWS)
+                    buffer = np.resize(buffer, (capacity, len(FEATURES)))
+                    line_numbers = np.resize(line_numbers, capacity)
+                buffer[num_rows] = row
+            except (ValueError, KeyError, TypeError) as e:
+                return jsonify({
+                    'error': f'Invalid reading on line {line_number}',
+                    'message': str(e)
+                }), 400
+            
+            line_numbers[num_rows] = line_number
+            num_rows += 1
+        
+        # null becomes NaN (and out-of-range numbers inf) in the buffer;
+        # checked once for all rows rather than per row
+        invalid_rows = np.flatnonzero(~np.isfinite(buffer[:num_rows]).all(axis=1))
+        if len(invalid_rows):
+            return jsonify({
+                'error': f'Invalid reading on line {line_numbers[invalid_rows[0]]}',
+                'message': 'values must be finite numbers'
+            }), 400
+        
+        if num_rows < 100:
+            return jsonify({
+                'error': 'Need at least 100 training samples'
+            }), 400
+        
+        # Retrain model (skip the validation pass for fast field-data updates)
+        model.train(buffer[:num_rows], validate=False)
+        _save_retrained_model()
+        
+        logger.info(f"Model retrained with {num_rows} streamed samples"
+                   f"{' (truncated)' if truncated else ''}")
+        
+        return jsonify({
+            'status': 'success',
+            'training_samples': num_rows,
+            'truncated': truncated,
+            'message': 'Model retrained successfully'
+        }), 200
+        
+    except Exception as e:
+        logger.error(f"Retraining failed: {e}")
+        return jsonify({
+            'error': 'Retraining failed',
+            'message': str(e)
+        }), 500
+
+
 @app.route('/model/info', methods=['GET'])
 def model_info():
     """
@@ -171,19 +484,49 @@ def model_info():
     return jsonify(model.get_info()), 200
 
 
-if __name__ == '__main__':
-    logger.info("🚀 Starting SolarSentinel AI Server...")
-    logger.info("📊 Training model on synthetic data...")
+def load_or_train_model():
+    """
+    Load the cached model for MODEL_VERSION, training and caching it if absent
     
-    # Train model on startup (using synthetic data)
-    if model:
+    A cache file that cannot be loaded (corrupt, or written by incompatible
+    sklearn/numba versions) is treated as absent and overwritten.
+    """
+    global _loaded_model_file
+    
+    identity = _model_file_identity()
+    if identity is not None:
         try:
-            from data.generate_training_data import generate_synthetic_data
-            training_data = generate_synthetic_data(num_samples=10000)
-            model.train(training_data)
-            logger.info(f"✅ Model trained on {len(training_data)} synthetic samples")
+            model.load_model(MODEL_PATH)
+            _loaded_model_file = identity
+            logger.info(f"✅ Loaded cached model ({model.training_samples} training samples)")
+            return
         except Exception as e:
-            logger.error(f"❌ Training failed: {e}")
+            logger.warning(f"Cached model unusable, retraining: {e}")
+    
+    logger.info("📊 Training model on synthetic data...")
+    from data.generate_training_data import generate_synthetic_data
+    training_data, _ = generate_synthetic_data(
+        num_samples=10000, return_array=True
+    )
+    model.train(training_data, validate=True)
+    logger.info(f"✅ Model trained on {len(training_data)} synthetic samples")
     
-    # Start server
-    app.run(host='0.0.0.0', port=5000, debug=False)
\ No newline at end of file
+    model.save_model(MODEL_PATH)
+    _loaded_model_file = _model_file_identity()
+
+
+# Load cached model, or train on startup (using synthetic data).
+# Runs at import so `gunicorn --preload` prepares the model once in the
+# master process and forked workers share it instead of retraining.
+if model:
+    try:
+        load_or_train_model()
+    except Exception as e:
+        logger.error(f"❌ Training failed: {e}")
+
+
+if __name__ == '__main__':
+    # Development server only; production runs under gunicorn
+    # (see gunicorn.conf.py)
+    logger.info("🚀 Starting SolarSentinel AI Server...")
+    app.run(host='0.0.0.0', port=5000, debug=False)